@@ -1,15 +1,33 @@
 # Helpers to stream augmented diffs from the OSMCha site.
+import asyncio
+import io
 import logging
-import time
-import xml.etree.ElementTree as ET
-from typing import Iterator
+from typing import AsyncIterator
 
-import requests
+import httpx
+
+try:
+    from lxml import etree as ET
+
+    HAS_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+    HAS_LXML = False
 
 from src.osm import OSMObject
 
 ADIFF_SERVICE_URL_TEMPLATE = "https://adiffs.osmcha.org/replication/minute/{seqn}.adiff"
 
+# Number of downloaded adiffs allowed to wait for the consumer
+PREFETCH_DEPTH = 2
+
+# Server errors worth retrying, and how many times to retry them
+RETRY_STATUSES = {502, 503, 504}
+MAX_RETRIES = 3
+
+logger = logging.getLogger(__name__)
+
 
 class ChangeContainer:
     def __init__(
@@ -50,16 +68,70 @@ class ChangeContainer:
         )
 
         for action_element in elem.findall("action"):
-            action = Action.from_element(action_element)
-            if action_element.attrib["type"] == "create":
-                container.creates.append(action)
-            elif action_element.attrib["type"] == "modify":
-                container.modifies.append(action)
-            elif action_element.attrib["type"] == "delete":
-                container.deletes.append(action)
+            container.add(Action.from_element(action_element))
+
+        return container
+
+    @classmethod
+    def from_file(cls, source) -> "ChangeContainer":
+        """
+        Incrementally parse an augmented diff from a file-like object, freeing
+        each <action> element as soon as it has been turned into an Action so
+        that the whole document is never held in memory at once.
+
+        :param source: a file-like object (e.g. a streamed response body)
+        :return: the parsed change container
+        """
+        if HAS_LXML:
+            events = ET.iterparse(
+                source, events=("start", "end"), tag=("osm", "action")
+            )
+        else:
+            events = ET.iterparse(source, events=("start", "end"))
+
+        container = None
+        root = None
+        for event, elem in events:
+            if event == "start":
+                if root is None:
+                    root = elem
+                    container = cls(
+                        version=elem.attrib["version"],
+                        generator=elem.attrib["generator"],
+                        note=elem.get("note"),
+                        creates=[],
+                        modifies=[],
+                        deletes=[],
+                    )
+                continue
+
+            if elem.tag != "action":
+                continue
+
+            container.add(Action.from_element(elem))
+
+            # Drop the action subtree (and any already-processed siblings) so
+            # memory use stays bounded by the size of a single action
+            elem.clear()
+            if HAS_LXML:
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+            else:
+                root.remove(elem)
 
         return container
 
+    def add(self, action: "Action"):
+        """
+        Adds the given action to the list matching its type.
+        """
+        if action.action == "create":
+            self.creates.append(action)
+        elif action.action == "modify":
+            self.modifies.append(action)
+        elif action.action == "delete":
+            self.deletes.append(action)
+
     def changes(self) -> list["Action"]:
         """
         :return: a list of all changes in this container
@@ -68,6 +140,10 @@ class ChangeContainer:
 
 
 class Action:
+    # Compiled once so lxml doesn't re-parse the path expression on every call
+    _OLD = ET.XPath("old/*[1]") if HAS_LXML else None
+    _NEW = ET.XPath("new/*[1]") if HAS_LXML else None
+
     def __init__(self, action: str, old: OSMObject, new: OSMObject):
         self.action = action
         self.old = old
@@ -78,38 +154,113 @@ class Action:
             self.action, self.old, self.new
         )
 
+    @property
+    def changeset(self) -> int:
+        """
+        :return: the ID of the changeset that made this change
+        """
+        return self.new.changeset if self.new is not None else self.old.changeset
+
     @classmethod
     def from_element(cls, elem: ET.Element) -> "Action":
-        old_element = elem.find("old/*")
+        if HAS_LXML:
+            old_matches = cls._OLD(elem)
+            old_element = old_matches[0] if old_matches else None
+            new_matches = cls._NEW(elem)
+            new_element = new_matches[0] if new_matches else None
+        else:
+            old_element = elem.find("old/*")
+            new_element = elem.find("new/*")
+
         old_obj = (
             OSMObject.from_element(old_element) if old_element is not None else None
         )
-        new_element = elem.find("new/*")
         new_obj = (
             OSMObject.from_element(new_element) if new_element is not None else None
         )
         return cls(action=elem.attrib["type"], old=old_obj, new=new_obj)
 
 
-def stream_adiff(seqn: int = None) -> Iterator[ChangeContainer]:
-    logger = logging.getLogger(__name__)
+def _http_client() -> httpx.AsyncClient:
+    """
+    :return: an HTTP/2 client whose connection to the adiff service is kept
+        alive between minutes
+    """
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(60, connect=5),
+        # retries here only covers failures to connect
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=4, max_connections=8),
+            retries=MAX_RETRIES,
+        ),
+    )
+
+
+async def _fetch_adiff(client: httpx.AsyncClient, seqn: int) -> bytes | None:
+    """
+    :param client: the HTTP client to fetch with
+    :param seqn: sequence number of the minutely adiff to fetch
+    :return: the raw adiff body, or None if it hasn't been published yet
+    """
+    url = ADIFF_SERVICE_URL_TEMPLATE.format(seqn=seqn)
+    logger.info("Fetching %s", url)
 
-    while True:
-        url = ADIFF_SERVICE_URL_TEMPLATE.format(seqn=seqn)
-        logger.info("Fetching %s", url)
-        resp = requests.get(url)
+    for attempt in range(MAX_RETRIES + 1):
+        resp = await client.get(url)
 
         if resp.status_code == 404:
-            logger.info("No changes found for seqn %d, waiting 30 sec", seqn)
-            time.sleep(30)
+            return None
+
+        if resp.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+            await asyncio.sleep(0.5 * 2**attempt)
             continue
 
         resp.raise_for_status()
+        return resp.content
+
+
+async def _prefetch_adiffs(seqn: int, out: asyncio.Queue):
+    """
+    Downloads adiffs starting at seqn into the given queue until cancelled.
+
+    The queue is bounded, so this only runs PREFETCH_DEPTH diffs ahead of the
+    consumer. Any error is handed to the consumer to be re-raised there.
+    """
+    try:
+        async with _http_client() as client:
+            while True:
+                body = await _fetch_adiff(client, seqn)
+
+                if body is None:
+                    logger.info("No changes found for seqn %d, waiting 30 sec", seqn)
+                    await asyncio.sleep(30)
+                    continue
+
+                await out.put((seqn, body))
+                seqn += 1
+    except Exception as e:
+        await out.put((seqn, e))
+
+
+def _parse_adiff(body: bytes) -> ChangeContainer:
+    return ChangeContainer.from_file(io.BytesIO(body))
+
 
-        # parse the adiff and yield the change
-        tree = ET.fromstring(resp.content)
-        container = ChangeContainer.from_element(tree)
+async def stream_adiff(seqn: int = None) -> AsyncIterator[ChangeContainer]:
+    # Download the next diffs in a background task so the network round trip
+    # overlaps with parsing and processing the current one
+    prefetched = asyncio.Queue(maxsize=PREFETCH_DEPTH)
+    producer = asyncio.create_task(_prefetch_adiffs(seqn, prefetched))
 
-        yield container
+    try:
+        while True:
+            seqn, body = await prefetched.get()
+            if isinstance(body, Exception):
+                raise body
 
-        seqn += 1
+            logger.info("Parsing adiff %d (%d bytes)", seqn, len(body))
+            # Parse off the event loop so other tasks keep running meanwhile
+            yield await asyncio.to_thread(_parse_adiff, body)
+    finally:
+        producer.cancel()
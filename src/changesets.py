@@ -0,0 +1,155 @@
+# Cache of changeset metadata fetched from the OSM API
+import asyncio
+import logging
+import os
+import shelve
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+try:
+    from pyroaring import BitMap
+except ImportError:
+    BitMap = set
+
+from src.osm import OSMAPI, Changeset
+
+DEFAULT_CACHE_PATH = os.path.expanduser("~/.cache/osm-overwatch/changesets")
+
+logger = logging.getLogger(__name__)
+
+
+class ChangesetCache:
+    """
+    Bounded in-memory LRU cache of changesets, backed by an on-disk shelf so that
+    metadata survives restarts. Changesets missing from both are fetched from the
+    OSM API in batches.
+    """
+
+    def __init__(
+        self,
+        osm_api: OSMAPI,
+        max_size: int = 100_000,
+        path: str | None = DEFAULT_CACHE_PATH,
+    ):
+        self.osm_api = osm_api
+        self.max_size = max_size
+        self._memory: OrderedDict[int, Changeset] = OrderedDict()
+
+        # The shelf is opened, used and closed on this one thread. Some dbm
+        # backends (e.g. sqlite3, the default from Python 3.13) can only be used
+        # from the thread that opened them, and it keeps disk I/O off the event
+        # loop in get_many_async().
+        self._shelf_thread = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="changeset-cache"
+        )
+
+        self._disk = None
+        # IDs of the changesets on disk, as a compressed bitmap when pyroaring is
+        # available, so misses don't have to be looked up in the shelf
+        self._on_disk = BitMap()
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._on_shelf_thread(self._open, path)
+
+    def _on_shelf_thread(self, fn, *args):
+        return self._shelf_thread.submit(fn, *args).result()
+
+    def _open(self, path: str):
+        self._disk = shelve.open(path)
+        self._on_disk = BitMap(int(key) for key in self._disk.keys())
+
+    def close(self):
+        if self._disk is not None:
+            self._on_shelf_thread(self._disk.close)
+            self._disk = None
+        self._shelf_thread.shutdown()
+
+    def _remember(self, changeset: Changeset):
+        self._memory[changeset.id] = changeset
+        self._memory.move_to_end(changeset.id)
+        if len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _load(self, changeset_id: int) -> Changeset | None:
+        if self._disk is None or changeset_id not in self._on_disk:
+            return None
+
+        changeset = self._disk.get(str(changeset_id))
+        if changeset is not None:
+            self._remember(changeset)
+
+        return changeset
+
+    def _lookup_many(
+        self, changeset_ids: set[int]
+    ) -> tuple[dict[int, Changeset], list[int]]:
+        """
+        :return: the changesets found in memory or on disk keyed by ID, and the
+            IDs that have to be fetched
+        """
+        # Split into in-memory hits and the rest with a set operation rather than
+        # a lookup per ID, then only go to disk for what isn't in memory
+        in_memory = changeset_ids & self._memory.keys()
+        found = {}
+        for changeset_id in in_memory:
+            self._memory.move_to_end(changeset_id)
+            found[changeset_id] = self._memory[changeset_id]
+
+        misses = []
+        for changeset_id in changeset_ids - in_memory:
+            changeset = self._load(changeset_id)
+            if changeset is not None:
+                found[changeset_id] = changeset
+            else:
+                misses.append(changeset_id)
+
+        logger.info(
+            "Fetching metadata for %d changesets we have not seen yet", len(misses)
+        )
+        return found, misses
+
+    def _store(self, changesets: list[Changeset], found: dict[int, Changeset]):
+        for changeset in changesets:
+            self._remember(changeset)
+            if self._disk is not None:
+                self._disk[str(changeset.id)] = changeset
+                self._on_disk.add(changeset.id)
+            found[changeset.id] = changeset
+
+        if self._disk is not None:
+            self._disk.sync()
+
+    def get_many(self, changeset_ids: Iterable[int]) -> dict[int, Changeset]:
+        """
+        :param changeset_ids: IDs of the changesets to look up
+        :return: the changesets that could be found, keyed by ID
+        """
+        found, misses = self._on_shelf_thread(self._lookup_many, set(changeset_ids))
+        if misses:
+            changesets = self.osm_api.changesets(misses)
+            self._on_shelf_thread(self._store, changesets, found)
+
+        return found
+
+    async def get_many_async(
+        self, changeset_ids: Iterable[int]
+    ) -> dict[int, Changeset]:
+        """
+        Like get_many(), but fetches missing changesets with the OSM API's async
+        client so the requests overlap without blocking the event loop. Reads and
+        writes to the shelf are awaited on the shelf's own thread.
+        """
+        loop = asyncio.get_running_loop()
+        found, misses = await loop.run_in_executor(
+            self._shelf_thread, self._lookup_many, set(changeset_ids)
+        )
+        if misses:
+            changesets = await self.osm_api.changesets_async(misses)
+            await loop.run_in_executor(
+                self._shelf_thread, self._store, changesets, found
+            )
+
+        return found
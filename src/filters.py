@@ -1,10 +1,30 @@
+from collections import defaultdict
+from typing import Iterator
+
+import numpy as np
 import shapely
 
 from src.adiff import Action
-from src.osm import OSMType
+from src.osm import NODE, RELATION, OSMObject
+
+# Number of shape filters at which ShapeFilterBank switches to an STRtree
+STRTREE_MIN_FILTERS = 16
+
+# Number of TagValueInListFilters at which a user's filters use a TagFilterBank
+TAG_BANK_MIN_FILTERS = 4
+
+_NO_BBOX = (np.nan, np.nan, np.nan, np.nan)
 
 
 class ChangeFilter:
+    # Rough relative cost of matches(), used to run cheap filters first:
+    # 0 for id/uid comparisons, 1 for tag lookups, 2 for geometry checks
+    COST = 0
+
+    # Set on filters that read changeset metadata, which then has to be fetched
+    # for every changeset in a diff before filtering
+    NEEDS_CHANGESET_METADATA = False
+
     def matches(self, change: Action) -> bool:
         """Returns True if the change matches the filter."""
         raise NotImplementedError()
@@ -13,6 +33,17 @@ class ChangeFilter:
         """Returns a human-readable explanation of the filter."""
         raise NotImplementedError()
 
+    def compile(self, name: str) -> tuple[str, dict]:
+        """
+        Returns a Python expression equivalent to matches(), for inlining into a
+        generated function by UserInterest.
+
+        The expression can use the locals `change`, `action`, `old`, `new` and
+        `obj` (old if it exists, otherwise new), plus any names in the returned
+        bindings dict. Binding names must start with `name` to stay unique.
+        """
+        return f"{name}.matches(change)", {name: self}
+
 
 class UserIDChangedFilter(ChangeFilter):
     """
@@ -21,14 +52,22 @@ class UserIDChangedFilter(ChangeFilter):
 
     def __init__(self, user_id: int):
         self.user_id = user_id
+        self._explanation = f"User ID changed from {user_id}"
 
     def explanation(self) -> str:
-        return f"User ID changed from {self.user_id}"
+        return self._explanation
 
     def matches(self, change: Action) -> bool:
         action, old, new = change.action, change.old, change.new
         return old and new and old.uid == self.user_id and new.uid != self.user_id
 
+    def compile(self, name: str) -> tuple[str, dict]:
+        return (
+            f"old is not None and new is not None"
+            f" and old.uid == {name} and new.uid != {name}",
+            {name: self.user_id},
+        )
+
 
 class UserIDMadeChangeFilter(ChangeFilter):
     """
@@ -37,14 +76,18 @@ class UserIDMadeChangeFilter(ChangeFilter):
 
     def __init__(self, user_id: int):
         self.user_id = user_id
+        self._explanation = f"User ID {user_id} made a change"
 
     def explanation(self) -> str:
-        return f"User ID {self.user_id} made a change"
+        return self._explanation
 
     def matches(self, change: Action) -> bool:
         action, old, new = change.action, change.old, change.new
         return new and new.uid == self.user_id
 
+    def compile(self, name: str) -> tuple[str, dict]:
+        return f"new is not None and new.uid == {name}", {name: self.user_id}
+
 
 class NewUserFilter(ChangeFilter):
     """
@@ -77,12 +120,13 @@ class ObjectChangedFilter(ChangeFilter):
     Triggers on changes where the object of type `obj_type` with the given ID has changed.
     """
 
-    def __init__(self, obj_type: OSMType, id: int):
+    def __init__(self, obj_type: str, id: int):
         self.obj_type = obj_type
         self.obj_id = id
+        self._explanation = f"Object {obj_type} {id} changed"
 
     def explanation(self) -> str:
-        return f"Object {self.obj_type} {self.obj_id} changed"
+        return self._explanation
 
     def matches(self, change: Action) -> bool:
         action, old, new = change.action, change.old, change.new
@@ -95,48 +139,280 @@ class ObjectChangedFilter(ChangeFilter):
 
         return thing_to_check.id == self.obj_id
 
+    def compile(self, name: str) -> tuple[str, dict]:
+        return (
+            f"obj.id == {name}_id and obj.type == {name}_type",
+            {f"{name}_id": self.obj_id, f"{name}_type": self.obj_type},
+        )
+
 
 class ChangeInShapeFilter(ChangeFilter):
     """
     Triggers on changes where either old or new object intersects the given shape.
     """
 
+    COST = 2
+
     def __init__(self, shape: shapely.Polygon, name: str = None):
         self.shape = shape
         self.name = name
 
         # Prepare the shape for faster intersection checks
         shapely.prepare(self.shape)
+        self._bounds = self.shape.bounds
+        self._explanation = f'Change in shape "{name}"' if name else "Change in shape"
 
     def explanation(self) -> str:
-        return f'Change in shape "{self.name}"' if self.name else "Change in shape"
+        return self._explanation
 
     def matches(self, change: Action) -> bool:
-        action, old, new = change.action, change.old, change.new
+        obj = _object_to_check(change)
 
-        # TODO Skip relations for now because geometry checks are more difficult
-        if (old and old.type == OSMType.RELATION) or (
-            new and new.type == OSMType.RELATION
-        ):
+        # Cheap bounding box rejection before building any geometry
+        if obj is None or not _bboxes_overlap(obj.bbox, self._bounds):
             return False
 
-        old_shape = None
-        if old and old.visible:
-            old_shape = shapely.geometry.shape(old)
+        return self.shape.intersects(_to_shape(obj))
 
-        new_shape = None
-        if new and new.visible:
-            new_shape = shapely.geometry.shape(new)
 
-        # If the old and new object have the same changeset id, then it's likely
-        # a way whose nodes have changed position. We're going to ignore that
-        # change because the node change will cause the changeset to be included.
-        if old and new and old.changeset == new.changeset:
-            return False
+# Stands in for objects without any known coordinates, which intersect nothing
+_EMPTY = shapely.GeometryCollection()
+
+
+def _way_geometry(way: OSMObject) -> tuple[str, np.ndarray]:
+    """
+    Nodes without a known location are dropped, so what is left may no longer
+    be a ring (or even a line) even if the way itself is closed.
 
-        thing_to_check = new_shape or old_shape
+    :return: the kind of geometry to build for the way ("polygon", "line",
+        "point" or "empty") and the known coordinates to build it from
+    """
+    coords = way.coords
+    unknown = np.isnan(coords).any(axis=1)
+    known = coords[~unknown] if unknown.any() else coords
+
+    if way.is_closed and len(known) >= 4 and (known[0] == known[-1]).all():
+        return "polygon", known
+    if len(known) >= 2:
+        return "line", known
+    if len(known) == 1:
+        return "point", known
+    return "empty", known
+
+
+def _to_shape(obj: OSMObject) -> shapely.Geometry:
+    """
+    :return: a shapely geometry for the given node or way
+    """
+    # Call the constructors directly rather than going through the GeoJSON-like
+    # __geo_interface__ dict and shapely.geometry.shape's type dispatch
+    if obj.type is NODE:
+        if obj.lat is None or obj.lon is None:
+            return _EMPTY
+        return shapely.points(obj.lon, obj.lat)
+
+    kind, coords = _way_geometry(obj)
+    if kind == "polygon":
+        return shapely.polygons(coords)
+    if kind == "line":
+        return shapely.linestrings(coords)
+    if kind == "point":
+        return shapely.points(coords[0])
+    return _EMPTY
+
+
+def _to_shapes(objs: list[OSMObject]) -> np.ndarray:
+    """
+    :return: an array of shapely geometries for the given nodes and ways, built
+        with one vectorized constructor call per geometry type
+    """
+    geoms = np.empty(len(objs), dtype=object)
+    points, lines, rings = [], [], []
+    line_coords, ring_coords = [], []
+    for i, obj in enumerate(objs):
+        if obj.type is NODE:
+            if obj.lat is None or obj.lon is None:
+                geoms[i] = _EMPTY
+            else:
+                points.append(i)
+            continue
+
+        kind, coords = _way_geometry(obj)
+        if kind == "polygon":
+            rings.append(i)
+            ring_coords.append(coords)
+        elif kind == "line":
+            lines.append(i)
+            line_coords.append(coords)
+        elif kind == "point":
+            geoms[i] = shapely.points(coords[0])
+        else:
+            geoms[i] = _EMPTY
+
+    if points:
+        geoms[points] = shapely.points([(objs[i].lon, objs[i].lat) for i in points])
+    if lines:
+        geoms[lines] = _ragged(shapely.linestrings, line_coords)
+    if rings:
+        geoms[rings] = shapely.polygons(_ragged(shapely.linearrings, ring_coords))
+
+    return geoms
+
+
+def _ragged(constructor, coord_arrays: list[np.ndarray]) -> np.ndarray:
+    """
+    Calls a shapely constructor once for a list of coordinate arrays of
+    different lengths, returning one geometry per array.
+    """
+    lengths = [len(coords) for coords in coord_arrays]
+    indices = np.repeat(np.arange(len(coord_arrays)), lengths)
+    return constructor(np.concatenate(coord_arrays), indices=indices)
 
-        return thing_to_check and thing_to_check.intersects(self.shape)
+
+def _bboxes_overlap(a: tuple | None, b: tuple | None) -> bool:
+    """
+    :return: True if the (minx, miny, maxx, maxy) bounding boxes overlap
+    """
+    if a is None or b is None:
+        return False
+
+    return not (a[2] < b[0] or a[0] > b[2] or a[3] < b[1] or a[1] > b[3])
+
+
+def _object_to_check(change: Action) -> OSMObject | None:
+    """
+    :return: the object of the change that shape filters should test, or None
+        if the change should be ignored by shape filters
+    """
+    old, new = change.old, change.new
+
+    # TODO Skip relations for now because geometry checks are more difficult
+    if (old and old.type is RELATION) or (new and new.type is RELATION):
+        return None
+
+    # If the old and new object have the same changeset id, then it's likely
+    # a way whose nodes have changed position. We're going to ignore that
+    # change because the node change will cause the changeset to be included.
+    if old and new and old.changeset == new.changeset:
+        return None
+
+    if new and new.visible:
+        return new
+
+    if old and old.visible:
+        return old
+
+    return None
+
+
+class ShapeFilterBank:
+    """
+    Evaluates a group of shape filters against all changes in a diff at once.
+
+    Bounding boxes of every change are checked against the bounding boxes of
+    every filter shape in a single NumPy operation (or an STRtree query when
+    there are many filters), so geometries only get built and tested with GEOS
+    for the few changes that might intersect.
+    """
+
+    def __init__(self, filters: list[ChangeInShapeFilter]):
+        self.filters = filters
+        self._bboxes = np.array([f._bounds for f in filters], dtype=np.float64)
+
+        # Broadcasting every change against every filter is cheaper than walking
+        # a tree until there are many filters
+        self.tree = (
+            shapely.STRtree([f.shape for f in filters])
+            if len(filters) >= STRTREE_MIN_FILTERS
+            else None
+        )
+
+    def candidates(
+        self, changes: list[Action]
+    ) -> tuple[list[OSMObject | None], np.ndarray]:
+        """
+        :param changes: the changes to check
+        :return: the object to check for each change, and an (N changes, M filters)
+            boolean array that is True where the object's bounding box overlaps the
+            filter's bounding box
+        """
+        objs = [_object_to_check(change) for change in changes]
+        obj_bboxes = np.array(
+            [
+                obj.bbox if obj is not None and obj.bbox is not None else _NO_BBOX
+                for obj in objs
+            ],
+            dtype=np.float64,
+        ).reshape(-1, 4)
+
+        if self.tree is not None:
+            hit = np.zeros((len(objs), len(self.filters)), dtype=bool)
+            rows = np.flatnonzero(~np.isnan(obj_bboxes).any(axis=1))
+            obj_idx, filter_idx = self.tree.query(shapely.box(*obj_bboxes[rows].T))
+            hit[rows[obj_idx], filter_idx] = True
+            return objs, hit
+
+        # NaN bounds (no geometry) compare False, so they never hit
+        q = self._bboxes
+        hit = (
+            (obj_bboxes[:, None, 2] >= q[None, :, 0])
+            & (obj_bboxes[:, None, 0] <= q[None, :, 2])
+            & (obj_bboxes[:, None, 3] >= q[None, :, 1])
+            & (obj_bboxes[:, None, 1] <= q[None, :, 3])
+        )
+        return objs, hit
+
+    def match(self, changes: list[Action]) -> list[set[int]]:
+        """
+        :param changes: the changes to check
+        :return: for each filter in this bank, the IDs of changesets with a change
+            that intersects the filter's shape
+        """
+        objs, hit = self.candidates(changes)
+
+        # Only changes overlapping some filter go any further. Objects sent
+        # without metadata have no changeset that could be reported, so they're
+        # left out too.
+        rows = [
+            i
+            for i in np.flatnonzero(hit.any(axis=1))
+            if changes[i].changeset is not None
+        ]
+        objs = [objs[i] for i in rows]
+        hit = hit[rows]
+        changeset_ids = np.array([changes[i].changeset for i in rows], dtype=np.int64)
+        geoms = np.full(len(objs), None, dtype=object)
+        matched = [set() for _ in self.filters]
+
+        # A changeset often touches many objects in the same area, so first test
+        # one candidate per changeset for each filter, then only the remaining
+        # candidates of changesets that filter hasn't already recorded. Each pass
+        # is one GEOS call per filter, and geometries are only built for the rows
+        # that actually get tested.
+        untested = hit.copy()
+        for first_pass in (True, False):
+            todo = []
+            for j, recorded in enumerate(matched):
+                rows = np.flatnonzero(untested[:, j])
+                if first_pass:
+                    _, first = np.unique(changeset_ids[rows], return_index=True)
+                    rows = rows[first]
+                    untested[rows, j] = False
+                elif recorded:
+                    known = np.fromiter(recorded, dtype=np.int64, count=len(recorded))
+                    rows = rows[~np.isin(changeset_ids[rows], known)]
+                todo.append(rows)
+
+            needed = np.concatenate(todo)
+            needed = np.unique(needed[geoms[needed] == None])  # noqa: E711
+            if len(needed):
+                geoms[needed] = _to_shapes([objs[i] for i in needed])
+
+            for filter, rows, recorded in zip(self.filters, todo, matched):
+                mask = shapely.intersects(filter.shape, geoms[rows])
+                recorded.update(changeset_ids[rows][mask].tolist())
+
+        return matched
 
 
 class ChangeInBoundingBoxFilter(ChangeInShapeFilter):
@@ -147,20 +423,9 @@ class ChangeInBoundingBoxFilter(ChangeInShapeFilter):
     """
 
     def __init__(self, bbox: tuple[float, float, float, float], name: str = None):
-        bbox_geojson = {
-            "type": "Polygon",
-            "coordinates": [
-                [
-                    [bbox[0], bbox[1]],
-                    [bbox[0], bbox[3]],
-                    [bbox[2], bbox[3]],
-                    [bbox[2], bbox[1]],
-                    [bbox[0], bbox[1]],
-                ]
-            ],
-        }
         super().__init__(
-            shapely.geometry.shape(bbox_geojson), name=name or f"bbox {bbox}"
+            shapely.box(bbox[0], bbox[1], bbox[2], bbox[3]),
+            name=name or f"bbox {bbox}",
         )
 
 
@@ -169,23 +434,76 @@ class TagValueInListFilter(ChangeFilter):
     Triggers on changes where an object's tag with the given key has changed to one of the given values.
     """
 
+    COST = 1
+
     def __init__(self, tag: str, values: list[str]):
+        values = list(values)
         self.tag = tag
-        self.values = values
+        # Set for O(1) membership checks in matches()
+        self.values = frozenset(values)
 
-    def explanation(self) -> str:
-        if len(self.values) > 3:
-            return f"Tag {self.tag} changed to one of {self.values[:3]} and {len(self.values) - 3} more"
+        if len(values) > 3:
+            self._explanation = (
+                f"Tag {tag} changed to one of {values[:3]} and {len(values) - 3} more"
+            )
+        else:
+            self._explanation = f"Tag {tag} changed to one of {values}"
 
-        return f"Tag {self.tag} changed to one of {self.values}"
+    def explanation(self) -> str:
+        return self._explanation
 
     def matches(self, change: Action) -> bool:
-        action, old, new = change.action, change.old, change.new
+        new = change.new
+        if new is None:
+            return False
+
+        # Most changes don't have one of the values, so check that before
+        # looking at the old object at all
+        new_value = new.tags.get(self.tag)
+        if new_value not in self.values:
+            return False
+
+        old = change.old
+        return old is None or old.tags.get(self.tag) != new_value
+
+    def compile(self, name: str) -> tuple[str, dict]:
+        return (
+            f"new is not None and new.tags.get({name}_tag) in {name}_values"
+            f" and (old is None or old.tags.get({name}_tag) != new.tags.get({name}_tag))",
+            {f"{name}_tag": self.tag, f"{name}_values": self.values},
+        )
+
 
-        old_value = old.tags.get(self.tag) if old else None
-        new_value = new.tags.get(self.tag) if new else None
+class TagFilterBank:
+    """
+    Evaluates a group of TagValueInListFilters together.
+
+    Filters are indexed by tag key, so each change only checks filters for the
+    tags it actually has rather than looking up every filter's tag.
+    """
+
+    def __init__(self, filters: list[TagValueInListFilter]):
+        self.filters = filters
+
+        by_tag = defaultdict(list)
+        for i, f in enumerate(filters):
+            by_tag[f.tag].append((f.values, i))
+        self.by_tag = dict(by_tag)
 
-        return (old_value != new_value) and (new_value in self.values)
+    def matches_all(self, change: Action) -> Iterator[int]:
+        """
+        :return: indexes into self.filters of the filters that match the change
+        """
+        old, new = change.old, change.new
+        if new is None:
+            return
+
+        by_tag = self.by_tag
+        old_tags = old.tags if old is not None else {}
+        for key, value in new.tags.items():
+            for values, i in by_tag.get(key, ()):
+                if value in values and old_tags.get(key) != value:
+                    yield i
 
 
 class ObjectWithTagChangedFilter(ChangeFilter):
@@ -193,12 +511,15 @@ class ObjectWithTagChangedFilter(ChangeFilter):
     Triggers when an object with the given tag key and value has changed.
     """
 
+    COST = 1
+
     def __init__(self, tag: str, value: str):
         self.tag = tag
         self.value = value
+        self._explanation = f"Object with tag {tag}={value} changed"
 
     def explanation(self) -> str:
-        return f"Object with tag {self.tag}={self.value} changed"
+        return self._explanation
 
     def matches(self, change: Action) -> bool:
         action, old, new = change.action, change.old, change.new
@@ -211,3 +532,12 @@ class ObjectWithTagChangedFilter(ChangeFilter):
 
         # Return true if the old object had the tag and something changed, or if a new object with the tag was created
         return (old_has_tag and (old != new)) or (action == "create" and new_has_tag)
+
+    def compile(self, name: str) -> tuple[str, dict]:
+        return (
+            f"(old is not None and old.tags.get({name}_tag) == {name}_value"
+            f" and old is not new)"
+            f" or (action == 'create' and new is not None"
+            f" and new.tags.get({name}_tag) == {name}_value)",
+            {f"{name}_tag": self.tag, f"{name}_value": self.value},
+        )
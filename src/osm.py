@@ -1,21 +1,153 @@
 # Models for OSM data
-import xml.etree.ElementTree as ET
+import asyncio
+import io
+import math
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from enum import Enum
+from itertools import chain
+from operator import methodcaller
+from typing import Iterator
 
+import httpx
+import numpy as np
 import requests
+import shapely
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+try:
+    from lxml import etree as ET
 
-class OSMType(Enum):
-    NODE = "node"
-    WAY = "way"
-    RELATION = "relation"
+    HAS_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+    HAS_LXML = False
+
+# OSM timestamps (e.g. 2024-01-02T03:04:05Z) are parsed into aware UTC
+# datetimes. ciso8601 does this in C, and is quicker still than
+# datetime.fromisoformat. Either is called directly, as looking a timestamp up
+# in a cache costs more than parsing it again.
+try:
+    from ciso8601 import parse_datetime as _parse_iso8601
+except ImportError:
+    _parse_iso8601 = datetime.fromisoformat
+
+# Tag keys, user names and roles repeat across many objects, so they're
+# interned to share a single copy of each
+_intern = sys.intern
+
+# Names of the child elements read while parsing
+_TAG = "tag"
+_ND = "nd"
+_MEMBER = "member"
+
+# Under lxml, the child paths are compiled once rather than re-parsed for every
+# element
+if HAS_LXML:
+    _find_tags = ET.XPath(_TAG)
+    _find_nds = ET.XPath(_ND)
+    _find_members = ET.XPath(_MEMBER)
+else:
+    _find_tags = methodcaller("iterfind", _TAG)
+    _find_nds = methodcaller("iterfind", _ND)
+    _find_members = methodcaller("iterfind", _MEMBER)
+
+
+# The OSM API limits how many IDs fit in a single changesets request
+MAX_CHANGESETS_PER_REQUEST = 100
+
+
+def _tags_from_xml(elem: ET.Element) -> dict[str, str]:
+    """
+    :return: the tags of the given element, keyed by (interned) tag key
+    """
+    # Most nodes in a diff are untagged, and checking for children at all is
+    # much cheaper than running the tag path over an element without any
+    if not len(elem):
+        return {}
+
+    return {_intern(tag.get("k")): tag.get("v") for tag in _find_tags(elem)}
+
+
+def _batches(changeset_ids: list[int]) -> list[list[int]]:
+    """
+    :return: the given IDs split into lists that each fit in one request
+    """
+    return [
+        changeset_ids[i : i + MAX_CHANGESETS_PER_REQUEST]
+        for i in range(0, len(changeset_ids), MAX_CHANGESETS_PER_REQUEST)
+    ]
+
+
+def _iterparse(source, tags: tuple[str, ...]) -> Iterator[ET.Element]:
+    """
+    Incrementally parses an XML document, yielding each element with one of the
+    given tags as soon as it is complete. Once the caller is done with an
+    element it is cleared, along with any already-processed siblings, so memory
+    use stays bounded by the size of a single element.
+
+    :param source: a file-like object (e.g. a streamed response body)
+    :param tags: the names of the elements to yield
+    :return: an iterator over the matching elements
+    """
+    if HAS_LXML:
+        events = ET.iterparse(source, events=("end",), tag=tags, huge_tree=True)
+    else:
+        events = ET.iterparse(source, events=("end",))
+
+    for _, elem in events:
+        if elem.tag not in tags:
+            continue
+
+        yield elem
+
+        elem.clear()
+        if HAS_LXML:
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+
+# Object types are interned strings rather than an Enum, so checking an
+# object's type is a plain string (usually identity) comparison
+NODE = _intern("node")
+WAY = _intern("way")
+RELATION = _intern("relation")
+
+
+class OSMType:
+    """
+    The object type constants, kept under the name of the Enum they replaced so
+    existing callers keep working.
+    """
+
+    NODE = NODE
+    WAY = WAY
+    RELATION = RELATION
+
+
+# Maps a parsed type string to the matching constant, rejecting unknown types
+_OSMTYPE_BY_STR = {NODE: NODE, WAY: WAY, RELATION: RELATION}
 
 
 class OSMObject:
+    # Diffs hold a lot of these, so they're kept free of a per-instance __dict__
+    __slots__ = (
+        "type",
+        "id",
+        "version",
+        "timestamp",
+        "uid",
+        "user",
+        "changeset",
+        "visible",
+        "tags",
+    )
+
     def __init__(
         self,
-        _type: OSMType,
+        _type: str,
         _id: int,
         version: int,
         timestamp: datetime,
@@ -30,23 +162,30 @@ class OSMObject:
         self.version = version
         self.timestamp = timestamp
         self.uid = uid
-        self.user = user
+        self.user = _intern(user) if user else None
         self.changeset = changeset
         self.visible = visible
         self.tags = tags
 
     @classmethod
     def from_element(cls, element: ET.Element) -> "OSMObject":
-        if element.tag == "node":
-            return Node.from_xml(element)
-        elif element.tag == "way":
-            return Way.from_xml(element)
-        elif element.tag == "relation":
-            return Relation.from_xml(element)
-        raise ValueError("Unknown element type: {}".format(element.tag))
+        from_xml = _FROM_XML.get(element.tag)
+        if from_xml is None:
+            raise ValueError("Unknown element type: {}".format(element.tag))
+        return from_xml(element)
+
+    @property
+    def bbox(self) -> tuple[float, float, float, float] | None:
+        """
+        :return: the (min_lon, min_lat, max_lon, max_lat) bounds of this object,
+            or None if its geometry isn't known
+        """
+        return None
 
 
 class Node(OSMObject):
+    __slots__ = ("lat", "lon")
+
     def __init__(
         self,
         _id: int,
@@ -61,7 +200,7 @@ class Node(OSMObject):
         lon: float,
     ):
         super().__init__(
-            OSMType.NODE,
+            NODE,
             _id,
             version,
             timestamp,
@@ -78,24 +217,38 @@ class Node(OSMObject):
     def from_xml(cls, elem: ET.Element):
         # Note that osmx doesn't support metadata for untagged nodes, so it's
         # possible for a node to only have the ID present in the augmented diff
-        return cls(
-            _id=int(elem.attrib["id"]),
-            version=int(elem.attrib["version"]) if elem.attrib.get("version") else None,
-            timestamp=(
-                datetime.fromisoformat(elem.attrib["timestamp"])
-                if elem.attrib.get("timestamp")
-                else None
-            ),
-            uid=int(elem.attrib["uid"]) if elem.attrib.get("uid") else None,
-            user=elem.attrib["user"] if elem.attrib.get("user") else None,
-            changeset=(
-                int(elem.attrib["changeset"]) if elem.attrib.get("changeset") else None
-            ),
-            visible=elem.attrib.get("visible") != "false",
-            tags={tag.attrib["k"]: tag.attrib["v"] for tag in elem.findall("tag")},
-            lat=float(elem.attrib["lat"]) if elem.attrib.get("lat") else None,
-            lon=float(elem.attrib["lon"]) if elem.attrib.get("lon") else None,
-        )
+        a = elem.attrib
+        g = a.get
+        version = g("version")
+        timestamp = g("timestamp")
+        uid = g("uid")
+        changeset = g("changeset")
+        user = g("user")
+        lat = g("lat")
+        lon = g("lon")
+
+        # Set the slots directly rather than going through the __init__ chain
+        # and its keyword arguments for every element
+        node = object.__new__(cls)
+        node.type = NODE
+        node.id = int(a["id"])
+        node.version = int(version) if version else None
+        node.timestamp = _parse_iso8601(timestamp) if timestamp else None
+        node.uid = int(uid) if uid else None
+        node.user = _intern(user) if user else None
+        node.changeset = int(changeset) if changeset else None
+        node.visible = g("visible", "true") != "false"
+        node.tags = _tags_from_xml(elem)
+        node.lat = float(lat) if lat else None
+        node.lon = float(lon) if lon else None
+        return node
+
+    @property
+    def bbox(self) -> tuple[float, float, float, float] | None:
+        if self.lat is None or self.lon is None:
+            return None
+
+        return (self.lon, self.lat, self.lon, self.lat)
 
     @property
     def __geo_interface__(self):
@@ -106,6 +259,8 @@ class Node(OSMObject):
 
 
 class Way(OSMObject):
+    __slots__ = ("node_refs", "node_lats", "node_lons", "_coords", "_bbox")
+
     def __init__(
         self,
         _id: int,
@@ -116,10 +271,12 @@ class Way(OSMObject):
         changeset: int,
         visible: bool,
         tags: dict[str, str],
-        nodes: list["NodeRef"],
+        node_refs: np.ndarray,
+        node_lats: np.ndarray,
+        node_lons: np.ndarray,
     ):
         super().__init__(
-            OSMType.WAY,
+            WAY,
             _id,
             version,
             timestamp,
@@ -129,33 +286,126 @@ class Way(OSMObject):
             visible,
             tags,
         )
-        self.nodes = nodes
+        # The way's nodes are kept as parallel arrays rather than a list of
+        # NodeRefs. Unknown coordinates are NaN.
+        self.node_refs = np.asarray(node_refs, dtype=np.int64)
+        self.node_lats = np.asarray(node_lats, dtype=np.float64)
+        self.node_lons = np.asarray(node_lons, dtype=np.float64)
 
     @classmethod
     def from_xml(cls, elem: ET.Element):
         # Similar to Nodes, osmx doesn't support metadata for untagged ways, so it's possible
         # for ways to only have the ID present in the augmented diff
-        return cls(
-            _id=int(elem.attrib["id"]),
-            version=int(elem.attrib["version"]),
-            timestamp=(
-                datetime.fromisoformat(elem.attrib["timestamp"])
-                if elem.attrib.get("timestamp")
-                else None
-            ),
-            uid=int(elem.attrib["uid"]) if elem.attrib.get("uid") else None,
-            user=elem.attrib["user"] if elem.attrib.get("user") else None,
-            changeset=(
-                int(elem.attrib["changeset"]) if elem.attrib.get("changeset") else None
-            ),
-            visible=elem.attrib.get("visible") != "false",
-            tags={tag.attrib["k"]: tag.attrib["v"] for tag in elem.findall("tag")},
-            nodes=[NodeRef.from_xml(node) for node in elem.findall("nd")],
-        )
+        a = elem.attrib
+        g = a.get
+        timestamp = g("timestamp")
+        uid = g("uid")
+        user = g("user")
+        changeset = g("changeset")
+
+        way = object.__new__(cls)
+        way.type = WAY
+        way.id = int(a["id"])
+        way.version = int(a["version"])
+        way.timestamp = _parse_iso8601(timestamp) if timestamp else None
+        way.uid = int(uid) if uid else None
+        way.user = _intern(user) if user else None
+        way.changeset = int(changeset) if changeset else None
+        way.visible = g("visible", "true") != "false"
+        way.tags = _tags_from_xml(elem)
+        way.node_refs, way.node_lats, way.node_lons = cls._nodes_from_xml(elem)
+        return way
+
+    @staticmethod
+    def _nodes_from_xml(
+        elem: ET.Element,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # The number of children is an upper bound on the number of <nd>s, so
+        # the arrays are filled in one pass and trimmed afterwards
+        size = len(elem)
+        refs = np.empty(size, dtype=np.int64)
+        lats = np.full(size, np.nan)
+        lons = np.full(size, np.nan)
+
+        count = 0
+        for nd in _find_nds(elem):
+            g = nd.get
+            refs[count] = int(g("ref"))
+            lat = g("lat")
+            if lat:
+                lats[count] = float(lat)
+            lon = g("lon")
+            if lon:
+                lons[count] = float(lon)
+            count += 1
+
+        return refs[:count], lats[:count], lons[:count]
+
+    @property
+    def nodes(self) -> list["NodeRef"]:
+        """
+        :return: the way's nodes as NodeRef objects, built from its node arrays
+        """
+        return [
+            NodeRef(
+                ref,
+                None if math.isnan(lat) else lat,
+                None if math.isnan(lon) else lon,
+            )
+            for ref, lat, lon in zip(
+                self.node_refs.tolist(),
+                self.node_lats.tolist(),
+                self.node_lons.tolist(),
+            )
+        ]
+
+    @property
+    def coords(self) -> np.ndarray:
+        """
+        :return: an (N, 2) array of the way's lon/lat pairs, which shapely can use
+            without copying into Python lists first
+        """
+        try:
+            return self._coords
+        except AttributeError:
+            self._coords = np.column_stack((self.node_lons, self.node_lats))
+            return self._coords
+
+    @property
+    def is_closed(self) -> bool:
+        """
+        :return: True if the way starts and ends at the same node, forming a ring
+        """
+        refs = self.node_refs
+        return len(refs) >= 4 and bool(refs[0] == refs[-1])
+
+    @property
+    def bbox(self) -> tuple[float, float, float, float] | None:
+        # Computed on first use and kept in a slot, as there's no __dict__ for
+        # cached_property to store it in
+        try:
+            return self._bbox
+        except AttributeError:
+            pass
+
+        known = self.coords[~np.isnan(self.coords).any(axis=1)]
+        if not len(known):
+            self._bbox = None
+        else:
+            min_lon, min_lat = known.min(axis=0)
+            max_lon, max_lat = known.max(axis=0)
+            self._bbox = (
+                float(min_lon),
+                float(min_lat),
+                float(max_lon),
+                float(max_lat),
+            )
+
+        return self._bbox
 
     @property
     def __geo_interface__(self):
-        if not self.nodes:
+        if not len(self.node_refs):
             # If the way was deleted and only the ID is present in the diff, there won't be any nodes
             # to build a geometry from
             return {
@@ -163,41 +413,79 @@ class Way(OSMObject):
                 "coordinates": [],
             }
 
-        if self.nodes[0] == self.nodes[-1]:
+        # NumPy emits the lon/lat pairs in one go rather than node by node
+        coordinates = self.coords.tolist()
+        if self.is_closed:
             return {
                 "type": "Polygon",
-                "coordinates": [[[n.lon, n.lat] for n in self.nodes]],
+                "coordinates": [coordinates],
             }
         else:
             return {
                 "type": "LineString",
-                "coordinates": [[n.lon, n.lat] for n in self.nodes],
+                "coordinates": coordinates,
             }
 
 
 class NodeRef:
+    __slots__ = ("ref", "lat", "lon")
+
     def __init__(self, ref: int, lat: float = None, lon: float = None):
         self.ref = ref
-        self.lat = None
-        self.lon = None
+        self.lat = lat
+        self.lon = lon
 
     @classmethod
     def from_xml(cls, elem: ET.Element):
+        a = elem.attrib
+        g = a.get
+        lat = g("lat")
+        lon = g("lon")
         return cls(
-            ref=int(elem.attrib["ref"]),
-            lat=float(elem.attrib["lat"]) if elem.attrib.get("lat") else None,
-            lon=float(elem.attrib["lon"]) if elem.attrib.get("lon") else None,
+            ref=int(a["ref"]),
+            lat=float(lat) if lat else None,
+            lon=float(lon) if lon else None,
         )
 
 
 class RelationMember:
-    def __init__(self, _type: OSMType, _ref: int, role: str):
+    __slots__ = ("type", "ref", "role", "coords")
+
+    def __init__(
+        self, _type: str, _ref: int, role: str, coords: np.ndarray | None = None
+    ):
         self.type = _type
         self.ref = _ref
-        self.role = role
+        self.role = _intern(role) if role else role
+        # (N, 2) lon/lat array for way members whose geometry came with the
+        # relation, otherwise None
+        self.coords = coords
+
+    @classmethod
+    def from_xml(cls, elem: ET.Element):
+        a = elem.attrib
+        coords = None
+        # Diffs can include the geometry of way members as <nd> children
+        if len(elem):
+            coords = np.array(
+                [
+                    (float(nd.get("lon", "nan")), float(nd.get("lat", "nan")))
+                    for nd in _find_nds(elem)
+                ],
+                dtype=np.float64,
+            ).reshape(-1, 2)
+
+        return cls(
+            _type=_OSMTYPE_BY_STR[a["type"]],
+            _ref=int(a["ref"]),
+            role=a["role"],
+            coords=coords,
+        )
 
 
 class Relation(OSMObject):
+    __slots__ = ("members",)
+
     def __init__(
         self,
         _id: int,
@@ -211,7 +499,7 @@ class Relation(OSMObject):
         members: list[RelationMember],
     ):
         super().__init__(
-            OSMType.RELATION,
+            RELATION,
             _id,
             version,
             timestamp,
@@ -225,30 +513,53 @@ class Relation(OSMObject):
 
     @classmethod
     def from_xml(cls, elem: ET.Element):
-        return cls(
-            _id=int(elem.attrib["id"]),
-            version=int(elem.attrib["version"]),
-            timestamp=datetime.fromisoformat(elem.attrib["timestamp"]),
-            uid=int(elem.attrib["uid"]),
-            user=elem.attrib["user"],
-            changeset=int(elem.attrib["changeset"]),
-            visible=elem.attrib.get("visible") != "false",
-            tags={tag.attrib["k"]: tag.attrib["v"] for tag in elem.findall("tag")},
-            members=[
-                RelationMember(
-                    _type=OSMType(tag.attrib["type"]),
-                    _ref=int(tag.attrib["ref"]),
-                    role=tag.attrib["role"],
-                )
-                for tag in elem.findall("member")
-            ],
-        )
+        a = elem.attrib
+        relation = object.__new__(cls)
+        relation.type = RELATION
+        relation.id = int(a["id"])
+        relation.version = int(a["version"])
+        relation.timestamp = _parse_iso8601(a["timestamp"])
+        relation.uid = int(a["uid"])
+        relation.user = _intern(a["user"])
+        relation.changeset = int(a["changeset"])
+        relation.visible = a.get("visible", "true") != "false"
+        relation.tags = _tags_from_xml(elem)
+        relation.members = [RelationMember.from_xml(m) for m in _find_members(elem)]
+        return relation
+
+    def _member_lines(self, roles: tuple[str, ...] | None = None) -> list:
+        """
+        :param roles: only include members with one of these roles, or all of
+            them if None
+        :return: linestrings for the way members whose geometry is known
+        """
+        lines = []
+        for member in self.members:
+            if member.coords is None or (
+                roles is not None and member.role not in roles
+            ):
+                continue
+
+            coords = member.coords[~np.isnan(member.coords).any(axis=1)]
+            if len(coords) >= 2:
+                lines.append(shapely.linestrings(coords))
+
+        return lines
 
     @property
     def __geo_interface__(self):
-        raise NotImplementedError(
-            "Relation __geo_interface__ not implemented for Relations yet"
-        )
+        # Only members whose geometry came with the relation can be used. The
+        # ring assembly and line merging happen in GEOS rather than in Python.
+        if self.tags.get("type") in ("multipolygon", "boundary"):
+            outer = shapely.polygonize(self._member_lines(("outer", "")))
+            inner = shapely.polygonize(self._member_lines(("inner",)))
+            geometry = shapely.difference(
+                shapely.union_all(outer), shapely.union_all(inner)
+            )
+        else:
+            geometry = shapely.line_merge(shapely.MultiLineString(self._member_lines()))
+
+        return geometry.__geo_interface__
 
 
 class Changeset:
@@ -282,67 +593,208 @@ class Changeset:
 
     @classmethod
     def from_element(cls, elem: ET.Element) -> "Changeset":
+        a = elem.attrib
+        g = a.get
+        closed_at = g("closed_at")
+        min_lat = g("min_lat")
+        min_lon = g("min_lon")
+        max_lat = g("max_lat")
+        max_lon = g("max_lon")
         return cls(
-            _id=int(elem.attrib["id"]),
-            created_at=datetime.fromisoformat(elem.attrib["created_at"]),
-            closed_at=(
-                datetime.fromisoformat(elem.attrib["closed_at"])
-                if elem.attrib.get("closed_at")
-                else None
-            ),
-            open=elem.attrib["open"] == "true",
-            min_lat=(
-                float(elem.attrib["min_lat"]) if elem.attrib.get("min_lat") else None
-            ),
-            min_lon=(
-                float(elem.attrib["min_lon"]) if elem.attrib.get("min_lon") else None
-            ),
-            max_lat=(
-                float(elem.attrib["max_lat"]) if elem.attrib.get("max_lat") else None
-            ),
-            max_lon=(
-                float(elem.attrib["max_lon"]) if elem.attrib.get("max_lon") else None
-            ),
-            user_id=int(elem.attrib["uid"]),
-            user_name=elem.attrib["user"],
-            comments_count=int(elem.attrib["comments_count"]),
-            tags={tag.attrib["k"]: tag.attrib["v"] for tag in elem.findall("tag")},
+            _id=int(a["id"]),
+            created_at=_parse_iso8601(a["created_at"]),
+            closed_at=_parse_iso8601(closed_at) if closed_at else None,
+            open=a["open"] == "true",
+            min_lat=float(min_lat) if min_lat else None,
+            min_lon=float(min_lon) if min_lon else None,
+            max_lat=float(max_lat) if max_lat else None,
+            max_lon=float(max_lon) if max_lon else None,
+            user_id=int(a["uid"]),
+            user_name=a["user"],
+            comments_count=int(a["comments_count"]),
+            tags=_tags_from_xml(elem),
         )
 
 
+# Parser for each kind of OSM element
+_FROM_XML = {
+    NODE: Node.from_xml,
+    WAY: Way.from_xml,
+    RELATION: Relation.from_xml,
+}
+
+
+def parse_stream(xml_bytes: bytes) -> Iterator[OSMObject]:
+    """
+    Incrementally parses the nodes, ways and relations in an OSM XML document.
+    Each element is freed as soon as its object has been yielded, so prefer
+    this over ET.fromstring for anything bigger than a megabyte or so.
+
+    :param xml_bytes: the OSM XML document
+    :return: an iterator over the OSM objects in the document
+    """
+    for elem in _iterparse(io.BytesIO(xml_bytes), tuple(_FROM_XML)):
+        yield _FROM_XML[elem.tag](elem)
+
+
 class OSMAPI:
     def __init__(self, url: str = "https://api.openstreetmap.org/api/0.6"):
         self.url = url
+        self.headers = {
+            "Accept": "application/xml",
+            "Accept-Encoding": "gzip, deflate",
+            "User-Agent": "OSM Overwatch",
+        }
         self.session = requests.Session()
-        self.session.headers.update(
-            {
-                "Accept": "application/xml",
-                "User-Agent": "OSM Overwatch",
-            }
+        self.session.headers.update(self.headers)
+        self.session.mount(
+            "https://",
+            # Big enough that concurrent changeset fetches each keep a
+            # connection alive instead of reopening one per request
+            HTTPAdapter(
+                pool_connections=32,
+                pool_maxsize=64,
+                max_retries=Retry(
+                    total=5, backoff_factor=0.3, status_forcelist=(502, 503, 504)
+                ),
+            ),
+        )
+        # Building an lxml parser isn't free, so one is shared by every request
+        self._parser = (
+            ET.XMLParser(huge_tree=True, collect_ids=False) if HAS_LXML else None
         )
+        self._async_client = None
 
     def changeset(self, changeset_id: int) -> Changeset:
         """
         :param changeset_id: ID of the changeset to fetch
         :return: The changeset object for the given ID
         """
-        response = self.session.get(
-            f"{self.url}/changesets/{changeset_id}", stream=True
-        )
-        response.raise_for_status()
-        return Changeset.from_element(ET.fromstring(response.content))
+        with self.session.get(
+            f"{self.url}/changeset/{changeset_id}", timeout=(5, 60), stream=True
+        ) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            for elem in _iterparse(response.raw, ("changeset",)):
+                return Changeset.from_element(elem)
+
+        raise ValueError(f"No changeset in the response for {changeset_id}")
 
-    def changesets(self, changeset_ids_to_fetch: list[int]) -> list[Changeset]:
+    def changesets(
+        self, changeset_ids_to_fetch: list[int], max_workers: int = 8
+    ) -> list[Changeset]:
         """
+        Fetches the given changesets in batches of MAX_CHANGESETS_PER_REQUEST,
+        with the batches requested in parallel across the session's pool.
+
         :param changeset_ids_to_fetch: a list of changeset IDs to fetch
+        :param max_workers: the most batches to request at once
         :return: a list of changeset objects for the given IDs
         """
-        response = self.session.get(
+        batches = _batches(changeset_ids_to_fetch)
+        if len(batches) <= 1:
+            return self._changesets_batch(batches[0]) if batches else []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(
+                chain.from_iterable(executor.map(self._changesets_batch, batches))
+            )
+
+    def _changesets_batch(self, changeset_ids_to_fetch: list[int]) -> list[Changeset]:
+        # Parse changesets as the response arrives instead of after all of it
+        # has been downloaded
+        with self.session.get(
             f"{self.url}/changesets",
             params={"changesets": ",".join(map(str, changeset_ids_to_fetch))},
+            timeout=(5, 60),
             stream=True,
-        )
+        ) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            return [
+                Changeset.from_element(elem)
+                for elem in _iterparse(response.raw, ("changeset",))
+            ]
+
+    def _client(self) -> httpx.AsyncClient:
+        """
+        :return: the HTTP/2 client used by the async methods, created on first
+            use so that it belongs to the running event loop
+        """
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.url,
+                headers=self.headers,
+                timeout=httpx.Timeout(60, connect=5),
+                transport=httpx.AsyncHTTPTransport(
+                    http2=True,
+                    limits=httpx.Limits(max_keepalive_connections=32),
+                    retries=3,
+                ),
+            )
+
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    async def changeset_async(self, changeset_id: int) -> Changeset:
+        """
+        :param changeset_id: ID of the changeset to fetch
+        :return: The changeset object for the given ID
+        """
+        response = await self._client().get(f"/changeset/{changeset_id}")
         response.raise_for_status()
-        return [
-            Changeset.from_element(elem) for elem in ET.fromstring(response.content)
-        ]
+        # The changeset is wrapped in an <osm> element
+        root = ET.fromstring(response.content, parser=self._parser)
+        return Changeset.from_element(root.find("changeset"))
+
+    async def changesets_async(
+        self, changeset_ids_to_fetch: list[int], concurrency: int = 16
+    ) -> list[Changeset]:
+        """
+        Fetches the given changesets in batches of MAX_CHANGESETS_PER_REQUEST,
+        with up to `concurrency` batches in flight at once over the same
+        connection.
+
+        :param changeset_ids_to_fetch: a list of changeset IDs to fetch
+        :param concurrency: the most requests to have outstanding at a time
+        :return: a list of changeset objects for the given IDs
+        """
+        client = self._client()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(batch: list[int]) -> list[Changeset]:
+            async with semaphore:
+                response = await client.get(
+                    "/changesets", params={"changesets": ",".join(map(str, batch))}
+                )
+            response.raise_for_status()
+            return [
+                Changeset.from_element(elem)
+                for elem in ET.fromstring(response.content, parser=self._parser)
+            ]
+
+        batches = await asyncio.gather(
+            *(fetch(batch) for batch in _batches(changeset_ids_to_fetch))
+        )
+        return list(chain.from_iterable(batches))
+
+    def iter_changes(self, url: str) -> Iterator[OSMObject]:
+        """
+        Streams the nodes, ways and relations in an OSM XML response (e.g. from
+        /map or a changeset's /download), parsing them as they arrive and
+        freeing each one once it has been yielded.
+
+        :param url: the full URL to fetch
+        :return: an iterator over the OSM objects in the response
+        """
+        with self.session.get(url, timeout=(5, 60), stream=True) as response:
+            response.raise_for_status()
+            # Let urllib3 undo the gzip content encoding as we read
+            response.raw.decode_content = True
+
+            for elem in _iterparse(response.raw, ("node", "way", "relation")):
+                yield OSMObject.from_element(elem)
@@ -1,10 +1,118 @@
-from src.filters import ChangeFilter
+from typing import Callable
+
+from src.adiff import Action
+from src.filters import (
+    TAG_BANK_MIN_FILTERS,
+    ChangeFilter,
+    ChangeInShapeFilter,
+    ShapeFilterBank,
+    TagFilterBank,
+    TagValueInListFilter,
+)
 
 
 class UserInterest:
     def __init__(self, user_id: str, filters: list[ChangeFilter]):
         self.user_id = user_id
-        self.filters = filters
+        # Cheapest filters first so expensive ones only run when still needed
+        self.filters = sorted(filters, key=lambda f: f.COST)
+
+        # Shape filters are evaluated together, a whole diff at a time
+        self._change_filters = [
+            f for f in self.filters if not isinstance(f, ChangeInShapeFilter)
+        ]
+        shape_filters = [f for f in self.filters if isinstance(f, ChangeInShapeFilter)]
+        self._shape_bank = ShapeFilterBank(shape_filters) if shape_filters else None
+
+        # With enough of them, tag value filters are indexed by tag key so a change
+        # only looks at the tags it has instead of every filter
+        tag_filters = [
+            f for f in self._change_filters if isinstance(f, TagValueInListFilter)
+        ]
+        self._tag_bank = None
+        if len(tag_filters) >= TAG_BANK_MIN_FILTERS:
+            self._tag_bank = TagFilterBank(tag_filters)
+
+        # Filters sharing an explanation share a set of matched changesets
+        self._explanations = list(
+            dict.fromkeys(f.explanation() for f in self._change_filters)
+        )
+        self._make_matcher = self.compile()
 
     def __repr__(self):
         return "UserInterest(user_id={}, filters={})".format(self.user_id, self.filters)
+
+    def compile(self) -> Callable[..., Callable[[Action, int], None]]:
+        """
+        Generates a function with every non-shape filter's condition inlined, so
+        a change is checked against all of them without a method call per filter.
+
+        :return: a factory that takes one set per explanation (in the order of
+            self._explanations) and returns a `match(change, changeset_id)`
+            function adding changeset_id to the set of each filter that matches
+        """
+        sets = [f"m{i}" for i in range(len(self._explanations))]
+        namespace = {}
+        lines = [f"def _make_matcher({', '.join(sets)}):"]
+
+        if self._tag_bank:
+            namespace["tag_bank"] = self._tag_bank
+            tag_sets = [
+                sets[self._explanations.index(f.explanation())]
+                for f in self._tag_bank.filters
+            ]
+            lines.append(f"    tag_sets = ({', '.join(tag_sets)},)")
+
+        lines += [
+            "    def _match(change, changeset_id):",
+            "        action = change.action",
+            "        old = change.old",
+            "        new = change.new",
+            "        obj = old if old is not None else new",
+        ]
+        for i, filter in enumerate(self._change_filters):
+            if self._tag_bank and filter in self._tag_bank.filters:
+                continue
+
+            condition, bindings = filter.compile(f"f{i}")
+            namespace.update(bindings)
+            matched = sets[self._explanations.index(filter.explanation())]
+            # Once a changeset is flagged for a reason, skip the rest of it
+            lines.append(f"        if changeset_id not in {matched} and ({condition}):")
+            lines.append(f"            {matched}.add(changeset_id)")
+
+        if self._tag_bank:
+            lines.append("        for j in tag_bank.matches_all(change):")
+            lines.append("            tag_sets[j].add(changeset_id)")
+
+        lines.append("    return _match")
+
+        exec("\n".join(lines), namespace)
+        return namespace["_make_matcher"]
+
+    def interesting_changesets(self, changes: list[Action]) -> dict[str, set[int]]:
+        """
+        :param changes: the changes to check against this user's filters
+        :return: the IDs of changesets that matched, keyed by filter explanation
+        """
+        matched = [set() for _ in self._explanations]
+        match = self._make_matcher(*matched)
+
+        for change in changes:
+            match(change, change.changeset)
+
+        interesting = {
+            explanation: changeset_ids
+            for explanation, changeset_ids in zip(self._explanations, matched)
+            if changeset_ids
+        }
+
+        if self._shape_bank:
+            shape_matched = self._shape_bank.match(changes)
+            for filter, changeset_ids in zip(self._shape_bank.filters, shape_matched):
+                if changeset_ids:
+                    interesting.setdefault(filter.explanation(), set()).update(
+                        changeset_ids
+                    )
+
+        return interesting
@@ -0,0 +1,59 @@
+# Builders for OSM objects and changes used across the tests
+from src.adiff import Action
+from src.osm import Changeset, Node, Way
+
+
+def node(_id=1, changeset=100, lat=45.0, lon=-93.0, tags=None, uid=1, visible=True):
+    return Node(
+        _id=_id,
+        version=1,
+        timestamp=None,
+        uid=uid,
+        user="someone",
+        changeset=changeset,
+        visible=visible,
+        tags=tags or {},
+        lat=lat,
+        lon=lon,
+    )
+
+
+def way(refs, lats, lons, _id=1, changeset=100, tags=None, uid=1, visible=True):
+    return Way(
+        _id=_id,
+        version=1,
+        timestamp=None,
+        uid=uid,
+        user="someone",
+        changeset=changeset,
+        visible=visible,
+        tags=tags or {},
+        node_refs=refs,
+        node_lats=lats,
+        node_lons=lons,
+    )
+
+
+def changeset(_id, user_id=1, tags=None):
+    return Changeset(
+        _id=_id,
+        created_at=None,
+        closed_at=None,
+        open=False,
+        min_lat=None,
+        min_lon=None,
+        max_lat=None,
+        max_lon=None,
+        user_id=user_id,
+        user_name="someone",
+        comments_count=0,
+        tags=tags or {},
+    )
+
+
+def create(obj):
+    return Action(action="create", old=None, new=obj)
+
+
+def modify(old, new):
+    return Action(action="modify", old=old, new=new)
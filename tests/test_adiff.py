@@ -0,0 +1,73 @@
+import asyncio
+import contextlib
+
+import httpx
+import pytest
+
+from src import adiff
+
+ADIFF = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="test" note="minute {seqn}">
+  <action type="create">
+    <new><node id="{seqn}" version="1" timestamp="2024-01-02T03:04:05Z" uid="1"
+      user="someone" changeset="{seqn}" lat="45.0" lon="-93.0"/></new>
+  </action>
+</osm>"""
+
+
+def _serve(monkeypatch, handler):
+    real_sleep = asyncio.sleep
+
+    async def no_wait(delay):
+        await real_sleep(0)
+
+    monkeypatch.setattr(adiff.asyncio, "sleep", no_wait)
+    monkeypatch.setattr(
+        adiff,
+        "_http_client",
+        lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+
+def _seqn(request):
+    return int(request.url.path.rsplit("/", 1)[1].split(".")[0])
+
+
+def test_stream_adiff_yields_diffs_in_order(monkeypatch):
+    attempts = {}
+
+    def handler(request):
+        seqn = _seqn(request)
+        attempts[seqn] = attempts.get(seqn, 0) + 1
+        # The first minute fails once, and later ones aren't published yet
+        if seqn == 10 and attempts[seqn] == 1:
+            return httpx.Response(503)
+        if seqn > 12:
+            return httpx.Response(404)
+        return httpx.Response(200, content=ADIFF.format(seqn=seqn).encode())
+
+    _serve(monkeypatch, handler)
+
+    async def consume():
+        notes = []
+        async with contextlib.aclosing(adiff.stream_adiff(seqn=10)) as diffs:
+            async for diff in diffs:
+                notes.append(diff.note)
+                assert [c.changeset for c in diff.changes()] == [10 + len(notes) - 1]
+                if len(notes) == 3:
+                    break
+        return notes
+
+    assert asyncio.run(consume()) == ["minute 10", "minute 11", "minute 12"]
+    assert attempts[10] == 2
+
+
+def test_stream_adiff_raises_fetch_errors(monkeypatch):
+    _serve(monkeypatch, lambda request: httpx.Response(500))
+
+    async def consume():
+        async for diff in adiff.stream_adiff(seqn=10):
+            pass
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(consume())
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+
+from src import changesets
+from src.changesets import ChangesetCache
+from tests.helpers import changeset
+
+
+class FakeAPI:
+    def __init__(self):
+        self.requested = []
+
+    def changesets(self, ids):
+        self.requested.append(sorted(ids))
+        return [changeset(i, tags={"comment": f"changeset {i}"}) for i in ids]
+
+    async def changesets_async(self, ids):
+        return self.changesets(ids)
+
+
+def test_only_misses_are_fetched():
+    api = FakeAPI()
+    cache = ChangesetCache(api, path=None)
+
+    assert sorted(cache.get_many([1, 2])) == [1, 2]
+    assert sorted(cache.get_many([1, 2, 3])) == [1, 2, 3]
+    assert api.requested == [[1, 2], [3]]
+
+
+def test_least_recently_used_changeset_is_evicted():
+    api = FakeAPI()
+    cache = ChangesetCache(api, max_size=2, path=None)
+
+    cache.get_many([1, 2])
+    # Touch 1 so 2 is the least recently used when 3 comes in
+    cache.get_many([1])
+    cache.get_many([3])
+    assert list(cache._memory) == [1, 3]
+
+    cache.get_many([1, 2])
+    assert api.requested == [[1, 2], [3], [2]]
+
+
+def test_changesets_survive_restart(tmp_path):
+    path = str(tmp_path / "changesets")
+    cache = ChangesetCache(FakeAPI(), path=path)
+    cache.get_many([5, 6])
+    cache.close()
+
+    api = FakeAPI()
+    cache = ChangesetCache(api, max_size=1, path=path)
+    found = cache.get_many([5, 6])
+    cache.close()
+
+    assert api.requested == []
+    assert found[5].tags == {"comment": "changeset 5"}
+    assert found[6].user_name == "someone"
+
+
+def test_get_many_async_matches_get_many(tmp_path):
+    api = FakeAPI()
+    cache = ChangesetCache(api, path=str(tmp_path / "changesets"))
+
+    found = asyncio.run(cache.get_many_async([7, 8]))
+    assert sorted(found) == [7, 8]
+    assert sorted(cache.get_many([7, 8, 9])) == [7, 8, 9]
+    cache.close()
+
+    assert api.requested == [[7, 8], [9]]
+    assert sorted(cache._on_disk) == [7, 8, 9]
+
+
+def test_shelf_is_only_used_on_the_thread_that_opened_it(tmp_path, monkeypatch):
+    threads = []
+    shelve_open = changesets.shelve.open
+
+    def recording_open(*args):
+        threads.append(threading.current_thread())
+        return shelve_open(*args)
+
+    monkeypatch.setattr(changesets.shelve, "open", recording_open)
+    cache = ChangesetCache(FakeAPI(), path=str(tmp_path / "changesets"))
+    for method in ("_lookup_many", "_store"):
+        original = getattr(cache, method)
+
+        def record(*args, _original=original):
+            threads.append(threading.current_thread())
+            return _original(*args)
+
+        monkeypatch.setattr(cache, method, record)
+
+    asyncio.run(cache.get_many_async([1]))
+    cache.get_many([2])
+    cache.close()
+
+    assert len(threads) == 5
+    assert len(set(threads)) == 1
+    assert threads[0] is not threading.main_thread()
+
+
+def test_get_many_async_reads_back_from_disk(tmp_path):
+    path = str(tmp_path / "changesets")
+
+    async def fetch(api, ids):
+        cache = ChangesetCache(api, max_size=1, path=path)
+        try:
+            return await cache.get_many_async(ids)
+        finally:
+            cache.close()
+
+    asyncio.run(fetch(FakeAPI(), [5, 6]))
+    api = FakeAPI()
+    found = asyncio.run(fetch(api, [5, 6]))
+
+    assert api.requested == []
+    assert found[5].tags == {"comment": "changeset 5"}
+
+
+def test_relative_path_in_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = ChangesetCache(FakeAPI(), path="changesets")
+    cache.get_many([1])
+    cache.close()
+
+    assert list(tmp_path.iterdir())
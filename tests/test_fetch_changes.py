@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from src import fetch_changes
+
+
+class FakeAPI:
+    closed = False
+
+    async def aclose(self):
+        FakeAPI.closed = True
+
+
+class FakeCache:
+    closed = False
+
+    def __init__(self, osm_api):
+        pass
+
+    def close(self):
+        FakeCache.closed = True
+
+
+async def failing_stream(seqn):
+    raise ConnectionError("replication server went away")
+    yield
+
+
+def test_work_closes_clients_when_stream_fails(monkeypatch):
+    monkeypatch.setattr(fetch_changes, "OSMAPI", FakeAPI)
+    monkeypatch.setattr(fetch_changes, "ChangesetCache", FakeCache)
+    monkeypatch.setattr(fetch_changes, "stream_adiff", failing_stream)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(fetch_changes.work())
+
+    assert FakeAPI.closed
+    assert FakeCache.closed
@@ -0,0 +1,155 @@
+import math
+
+import numpy as np
+import pytest
+
+from src import filters
+from src.filters import (
+    STRTREE_MIN_FILTERS,
+    ChangeInBoundingBoxFilter,
+    ShapeFilterBank,
+    _to_shape,
+)
+from tests.helpers import create, node, way
+
+nan = math.nan
+
+BBOX = ChangeInBoundingBoxFilter(bbox=(-94.0, 44.0, -92.0, 46.0), name="box")
+
+
+def test_partially_located_closed_way_is_built_from_known_nodes():
+    # The first/last node has no location, so the rest no longer closes a ring
+    w = way(
+        [1, 2, 3, 4, 1],
+        [nan, 45.0, 45.1, 45.1, nan],
+        [nan, -93.0, -93.0, -92.9, nan],
+    )
+
+    shape = _to_shape(w)
+
+    assert shape.geom_type == "LineString"
+    assert len(shape.coords) == 3
+    assert BBOX.matches(create(w))
+
+
+def test_closed_way_with_unlocated_middle_node_stays_a_polygon():
+    w = way(
+        [1, 2, 3, 4, 5, 1],
+        [45.0, 45.0, nan, 45.1, 45.1, 45.0],
+        [-93.0, -92.9, nan, -92.9, -93.0, -93.0],
+    )
+
+    shape = _to_shape(w)
+
+    assert shape.geom_type == "Polygon"
+    assert not any(math.isnan(c) for xy in shape.exterior.coords for c in xy)
+
+
+def test_way_without_known_coordinates_matches_nothing():
+    w = way([1, 2, 3, 1], [nan] * 4, [nan] * 4)
+
+    assert _to_shape(w).is_empty
+    assert not BBOX.matches(create(w))
+
+
+def test_node_outside_bbox_does_not_match():
+    assert BBOX.matches(create(node(lat=45.0, lon=-93.0)))
+    assert not BBOX.matches(create(node(lat=10.0, lon=10.0)))
+
+
+def _random_changes(rng, count):
+    changes = []
+    for i in range(count):
+        changeset = 100 + int(rng.integers(0, count // 3 + 1))
+        if rng.random() < 0.4:
+            obj = node(
+                _id=i,
+                changeset=changeset,
+                lat=rng.uniform(40, 50),
+                lon=rng.uniform(-98, -88),
+            )
+        else:
+            n = int(rng.integers(2, 7))
+            lats = rng.uniform(40, 50, n)
+            lons = rng.uniform(-98, -88, n)
+            refs = list(range(n))
+            if rng.random() < 0.5:
+                # Close the way into a ring
+                refs.append(refs[0])
+                lats = np.append(lats, lats[0])
+                lons = np.append(lons, lons[0])
+            if rng.random() < 0.3:
+                # Some of the way's nodes have no known location
+                gone = rng.random(len(refs)) < 0.4
+                lats[gone] = np.nan
+                lons[gone] = np.nan
+            obj = way(refs, lats, lons, _id=i, changeset=changeset)
+        changes.append(create(obj))
+    return changes
+
+
+def _random_bbox_filters(rng, count):
+    filters = []
+    for i in range(count):
+        lon, lat = rng.uniform(-98, -88), rng.uniform(40, 50)
+        w, h = rng.uniform(0.1, 3, 2)
+        filters.append(
+            ChangeInBoundingBoxFilter((lon, lat, lon + w, lat + h), name=str(i))
+        )
+    return filters
+
+
+@pytest.mark.parametrize("filter_count", [3, STRTREE_MIN_FILTERS + 4])
+def test_shape_bank_agrees_with_per_filter_matches(filter_count):
+    rng = np.random.default_rng(filter_count)
+    filters = _random_bbox_filters(rng, filter_count)
+    changes = _random_changes(rng, 300)
+    bank = ShapeFilterBank(filters)
+    assert (bank.tree is not None) == (filter_count >= STRTREE_MIN_FILTERS)
+
+    matched = bank.match(changes)
+
+    for f, changeset_ids in zip(filters, matched):
+        assert changeset_ids == {c.changeset for c in changes if f.matches(c)}
+
+
+def test_shape_bank_handles_partially_located_closed_way():
+    w = way(
+        [1, 2, 3, 4, 1],
+        [nan, 45.0, 45.1, 45.1, nan],
+        [nan, -93.0, -93.0, -92.9, nan],
+        changeset=7,
+    )
+    unlocated = way([1, 2, 3, 1], [nan] * 4, [nan] * 4, changeset=8)
+
+    assert ShapeFilterBank([BBOX]).match([create(w), create(unlocated)]) == [{7}]
+
+
+def test_shape_bank_skips_changesets_already_recorded(monkeypatch):
+    built = []
+    to_shapes = filters._to_shapes
+
+    def counting_to_shapes(objs):
+        built.extend(objs)
+        return to_shapes(objs)
+
+    monkeypatch.setattr("src.filters._to_shapes", counting_to_shapes)
+
+    inside = [node(_id=i, changeset=1, lat=45.0, lon=-93.0) for i in range(10)]
+    elsewhere = [
+        node(_id=10, changeset=2, lat=0.0, lon=-93.0),
+        node(_id=11, changeset=2, lat=44.5, lon=-93.0),
+    ]
+    changes = [create(n) for n in inside + elsewhere]
+
+    assert ShapeFilterBank([BBOX]).match(changes) == [{1, 2}]
+    assert [n.id for n in built] == [0, 11]
+
+
+def test_shape_bank_skips_changes_without_changeset():
+    # osmx only sends the id of untagged objects, without their metadata
+    anonymous = node(_id=1, changeset=None, lat=45.0, lon=-93.0)
+    known = node(_id=2, changeset=7, lat=45.0, lon=-93.0)
+
+    assert ShapeFilterBank([BBOX]).match([create(anonymous), create(known)]) == [{7}]
+    assert ShapeFilterBank([BBOX]).match([create(anonymous)]) == [set()]
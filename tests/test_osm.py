@@ -0,0 +1,150 @@
+import asyncio
+import importlib.util
+import sys
+from datetime import datetime, timezone
+from itertools import chain
+
+import httpx
+import numpy as np
+import pytest
+import shapely.geometry
+
+from src import osm
+from src.osm import WAY, Relation, RelationMember, parse_stream
+from tests.helpers import changeset
+
+RELATION_XML = b"""<osm>
+<relation id="1" version="1" timestamp="2024-01-02T03:04:05Z" uid="1" user="a" changeset="100">
+  <member type="way" ref="10" role="outer">
+    <nd lat="0.0" lon="0.0"/><nd lat="0.0" lon="1.0"/><nd lat="1.0" lon="1.0"/>
+  </member>
+  <member type="way" ref="11" role="">
+    <nd lat="1.0" lon="1.0"/><nd lat="1.0" lon="0.0"/><nd lat="0.0" lon="0.0"/>
+  </member>
+  <tag k="type" v="multipolygon"/>
+</relation>
+</osm>"""
+
+
+def test_relation_member_accepts_missing_role():
+    assert RelationMember(WAY, 1, None).role is None
+    assert RelationMember(WAY, 1, "").role == ""
+    assert RelationMember(WAY, 1, "outer").role == "outer"
+
+
+def test_relation_members_are_assembled_into_polygon():
+    (relation,) = parse_stream(RELATION_XML)
+
+    assert isinstance(relation, Relation)
+    assert [m.role for m in relation.members] == ["outer", ""]
+    geometry = shapely.geometry.shape(relation.__geo_interface__)
+    assert geometry.equals(shapely.box(0.0, 0.0, 1.0, 1.0))
+
+
+def _osm_without_ciso8601(monkeypatch):
+    # Import a separate copy of the module, so the one used by other tests keeps
+    # its parser
+    monkeypatch.setitem(sys.modules, "ciso8601", None)
+    spec = importlib.util.spec_from_file_location("osm_without_ciso8601", osm.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize("fallback", [False, True], ids=["ciso8601", "fromisoformat"])
+def test_parse_timestamps(monkeypatch, fallback):
+    if fallback:
+        module = _osm_without_ciso8601(monkeypatch)
+        assert module._parse_iso8601 == datetime.fromisoformat
+    else:
+        ciso8601 = pytest.importorskip("ciso8601")
+        module = osm
+        assert module._parse_iso8601 is ciso8601.parse_datetime
+
+    parsed = module._parse_iso8601("2024-01-02T03:04:05Z")
+
+    assert parsed == datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    assert parsed.utcoffset().total_seconds() == 0
+
+    (node,) = module.parse_stream(
+        b"""<osm>
+<node id="1" version="1" timestamp="2024-01-02T03:04:05Z" uid="1" user="a"
+  changeset="100" lat="45.0" lon="-93.0"/>
+</osm>"""
+    )
+    assert node.timestamp == parsed
+
+
+def test_changesets_are_fetched_in_batches(monkeypatch):
+    api = osm.OSMAPI()
+    batches = []
+
+    def fetch_batch(ids):
+        batches.append(ids)
+        return [changeset(i) for i in ids]
+
+    monkeypatch.setattr(api, "_changesets_batch", fetch_batch)
+    ids = list(range(1, 2 * osm.MAX_CHANGESETS_PER_REQUEST + 2))
+
+    assert [c.id for c in api.changesets(ids, max_workers=3)] == ids
+    assert sorted(map(len, batches)) == [1] + [osm.MAX_CHANGESETS_PER_REQUEST] * 2
+    assert sorted(chain.from_iterable(batches)) == ids
+    assert api.changesets([]) == []
+
+
+def _changesets_xml(ids):
+    return "<osm>{}</osm>".format(
+        "".join(
+            f'<changeset id="{i}" created_at="2024-01-02T03:04:05Z" open="false"'
+            f' uid="1" user="someone" comments_count="0">'
+            f'<tag k="comment" v="changeset {i}"/></changeset>'
+            for i in ids
+        )
+    ).encode()
+
+
+def test_changesets_async_fetches_batches_concurrently():
+    requested = []
+
+    def handler(request):
+        ids = [int(i) for i in request.url.params["changesets"].split(",")]
+        requested.append(ids)
+        return httpx.Response(200, content=_changesets_xml(ids))
+
+    api = osm.OSMAPI()
+    api._async_client = httpx.AsyncClient(
+        base_url=api.url, transport=httpx.MockTransport(handler)
+    )
+    ids = list(range(1, osm.MAX_CHANGESETS_PER_REQUEST + 6))
+
+    async def fetch():
+        try:
+            return await api.changesets_async(ids, concurrency=2)
+        finally:
+            await api.aclose()
+
+    changesets = asyncio.run(fetch())
+
+    assert [c.id for c in changesets] == ids
+    assert changesets[0].tags == {"comment": "changeset 1"}
+    assert sorted(map(len, requested)) == [5, osm.MAX_CHANGESETS_PER_REQUEST]
+    assert api._async_client is None
+
+
+def test_way_nodes_without_location_parse_as_nan():
+    (way,) = parse_stream(
+        b"""<osm>
+<way id="5" version="1" timestamp="2024-01-02T03:04:05Z" uid="1" user="a" changeset="100">
+  <nd ref="1" lat="45.0" lon="-93.0"/><nd ref="2"/><nd ref="3" lat="45.1" lon="-92.9"/>
+  <nd ref="1" lat="45.0" lon="-93.0"/>
+  <tag k="highway" v="service"/>
+</way>
+</osm>"""
+    )
+
+    assert way.is_closed
+    assert way.tags == {"highway": "service"}
+    assert [n.ref for n in way.nodes] == [1, 2, 3, 1]
+    assert way.coords.shape == (4, 2)
+    assert np.isnan(way.coords[1]).all()
+    assert way.bbox == (-93.0, 45.0, -92.9, 45.1)
@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from src.adiff import Action
+from src.filters import (
+    TAG_BANK_MIN_FILTERS,
+    ChangeInBoundingBoxFilter,
+    ObjectChangedFilter,
+    ObjectWithTagChangedFilter,
+    TagValueInListFilter,
+    UserIDChangedFilter,
+    UserIDMadeChangeFilter,
+)
+from src.osm import NODE, WAY
+from src.users import UserInterest
+from tests.helpers import create, modify, node
+
+NAMES = ["stupid", "dumb", "fine", "Main Street"]
+
+
+def _random_node(rng, _id, changeset):
+    tags = {}
+    if rng.random() < 0.6:
+        tags["name"] = rng.choice(NAMES)
+    if rng.random() < 0.4:
+        tags["amenity"] = rng.choice(["cafe", "pub"])
+    return node(
+        _id=_id,
+        changeset=changeset,
+        lat=rng.uniform(44, 46),
+        lon=rng.uniform(-94, -92),
+        tags=tags,
+        uid=rng.choice([1, 2, 3]),
+    )
+
+
+def _random_changes(rng, count):
+    changes = []
+    for i in range(count):
+        changeset = rng.randrange(100, 100 + count // 4)
+        new = _random_node(rng, i % 20, changeset)
+        kind = rng.random()
+        if kind < 0.3:
+            changes.append(create(new))
+        elif kind < 0.8:
+            changes.append(modify(_random_node(rng, i % 20, changeset - 1), new))
+        else:
+            old = _random_node(rng, i % 20, changeset - 1)
+            changes.append(Action(action="delete", old=old, new=None))
+    return changes
+
+
+def _expected(filters, changes):
+    expected = {}
+    for f in filters:
+        changeset_ids = {c.changeset for c in changes if f.matches(c)}
+        if changeset_ids:
+            expected.setdefault(f.explanation(), set()).update(changeset_ids)
+    return expected
+
+
+@pytest.mark.parametrize("tag_filter_count", [1, TAG_BANK_MIN_FILTERS + 1])
+def test_compiled_matcher_agrees_with_filters(tag_filter_count):
+    rng = random.Random(tag_filter_count)
+    tag_filters = [
+        TagValueInListFilter(key, values)
+        for key, values in [
+            ("name", ["stupid", "dumb"]),
+            ("amenity", ["pub"]),
+            ("name", ["Main Street"]),
+            ("amenity", ["cafe", "pub"]),
+            ("shop", ["bakery"]),
+        ][:tag_filter_count]
+    ]
+    filters = tag_filters + [
+        UserIDChangedFilter(user_id=1),
+        UserIDMadeChangeFilter(user_id=2),
+        ObjectChangedFilter(NODE, 3),
+        ObjectChangedFilter(WAY, 3),
+        ObjectWithTagChangedFilter("amenity", "cafe"),
+        ChangeInBoundingBoxFilter((-93.5, 44.5, -93.0, 45.0), name="box"),
+    ]
+    changes = _random_changes(rng, 400)
+
+    interest = UserInterest("someone", filters)
+    assert (interest._tag_bank is not None) == (
+        tag_filter_count >= TAG_BANK_MIN_FILTERS
+    )
+
+    assert interest.interesting_changesets(changes) == _expected(filters, changes)